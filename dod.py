@@ -8,6 +8,7 @@ import copy
 import argparse
 import cmd
 from dod_game import *
+from dod_solver import AnytimeSolver
 
 # Shuffle the Motive deck well and place two cards face down to the side, making
 # sure that no one sees what they are. These cards are called the Evidence cards.
@@ -25,6 +26,8 @@ from dod_game import *
 
 DEFAULT_LOGFILE = 'dod'
 DEFAULT_LOG_LEVEL = 'INFO'
+DEFAULT_DEADLINE = 2.0
+DEFAULT_PROCESSES = 1
 
 def setup_logging(time_now, log_level, log_path, log_filename):
 
@@ -51,35 +54,42 @@ def setup_logging(time_now, log_level, log_path, log_filename):
     log = logging.getLogger()
     return log_file
 
-parser = argparse.ArgumentParser(description='Play a practice session of Deduce or Die')
-
-parser.add_argument('--logfile', dest='log_file', default=DEFAULT_LOGFILE,
-                        help='The name of the log file. Default={}_<timestamp>.log'.format(DEFAULT_LOGFILE))
-parser.add_argument('--level', dest='log_level', default=DEFAULT_LOG_LEVEL,
-                        help='Set the log level for the application log. ' \
-                             '[ERROR, WARN, INFO, DEBUG] Default={}'.format(DEFAULT_LOG_LEVEL))
-parser.add_argument( 'num_players', help='Number of players (3-6)')
-
-
-args = parser.parse_args()
-
-time_now = datetime.datetime.now()
-full_log_file = setup_logging(time_now, args.log_level, '.', args.log_file)
-
-
-log.info("Session Start: {players}".format(players=args.num_players))
+#
+# Argument types for options that must be more than 0
+#
+def positive_float(value):
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("{} is not a number".format(value))
+    if number <= 0:
+        raise argparse.ArgumentTypeError("{} must be more than 0".format(value))
+    return number
+
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("{} is not a whole number".format(value))
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} must be at least 1".format(value))
+    return number
 
 class DeduceCommands(cmd.Cmd):
     """Command processor for Deduce or Die"""
 
-    def __init__(self, num_players):
+    def __init__(self, num_players, deadline=DEFAULT_DEADLINE,
+                 processes=DEFAULT_PROCESSES):
         """Create a command processor for Deduce or Die
 
         Create a Deduce or Die session for the number of indicated
-        players. Initilize the startup messages.
+        players. Initilize the startup messages. Start solving for
+        the evidence in the background.
 
         Args:
             num_players : The number of players for the session
+            deadline : Seconds the solve command may take
+            processes : Number of processes used to sample an estimate
 
         Returns:
             An initilized command processor for Deduce or Die
@@ -106,6 +116,10 @@ Your hand: {}
         self.prompt = str(self.dod.question_cards) + ':'
         self.questions = []
 
+        self.deadline = deadline
+        self.solver = AnytimeSolver(processes)
+        self.solver.update(self.dod)
+
     doc_header = 'doc_header'
     misc_header = 'misc_header'
     undoc_header = 'undoc_header'
@@ -151,6 +165,7 @@ Your hand: {}
         * Get the count from the DoD session.
         * Print the number of cards that match the question.
         * Remember the question so it can be reported later
+        * Start solving with the new answer
         * Discard the current question cards
         * Draw 3 new question cards
         * Update the prompt
@@ -183,6 +198,13 @@ Your hand: {}
         self.questions.append(answer)
         log.info(answer)
 
+        #
+        #  Start solving with the new answer.
+        #  Asking yourself tells you nothing new.
+        #
+        if player != 1:
+            self.solver.update(self.dod)
+
         #
         #  Discard the old question cards.
         #  Deal new question cards.
@@ -212,7 +234,68 @@ Your hand: {}
         for q in self.questions:
             print q
 
+    def do_solve(self, line):
+        """Show the most likely evidence cards
+
+        Command Format:
+        > solve [seconds]
+        seconds is optional. It defaults to the --deadline option.
+
+        The evidence is solved exactly in the background after every
+        question. If the exact answer isn't ready within the time allowed
+        an estimate from weighted random deals is shown with confidence
+        bounds and its effective sample size.
+        The exact answer will be shown once it is ready.
+
+        Args:
+            line: The string that contains the paramaters after "solve"
+        """
+
+        parms = line.split()
+        budget = self.deadline
+        if parms:
+            try:
+                budget = float(parms[0])
+            except ValueError:
+                print "Non-numeric value for seconds"
+                return
+
+        if budget <= 0:
+            print "Seconds must be more than 0"
+            return
+
+        posterior = self.solver.posterior(budget)
+        print posterior
+        log.info(posterior)
+
     def do_EOF(self, line):
+        self.solver.stop()
         return True
 
-DeduceCommands(int(args.num_players)).cmdloop()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play a practice session of Deduce or Die')
+
+    parser.add_argument('--logfile', dest='log_file', default=DEFAULT_LOGFILE,
+                            help='The name of the log file. Default={}_<timestamp>.log'.format(DEFAULT_LOGFILE))
+    parser.add_argument('--level', dest='log_level', default=DEFAULT_LOG_LEVEL,
+                            help='Set the log level for the application log. ' \
+                                 '[ERROR, WARN, INFO, DEBUG] Default={}'.format(DEFAULT_LOG_LEVEL))
+    parser.add_argument('--deadline', dest='deadline', type=positive_float, default=DEFAULT_DEADLINE,
+                            help='Seconds the solve command may take before giving ' \
+                                 'an estimate. Default={}'.format(DEFAULT_DEADLINE))
+    parser.add_argument('--processes', dest='processes', type=positive_int, default=DEFAULT_PROCESSES,
+                            help='Number of processes used to sample an estimate. ' \
+                                 'Default={}'.format(DEFAULT_PROCESSES))
+    parser.add_argument( 'num_players', help='Number of players (3-6)')
+
+
+    args = parser.parse_args()
+
+    time_now = datetime.datetime.now()
+    full_log_file = setup_logging(time_now, args.log_level, '.', args.log_file)
+
+
+    log.info("Session Start: {players}".format(players=args.num_players))
+
+    DeduceCommands(int(args.num_players), args.deadline,
+                   args.processes).cmdloop()
@@ -438,6 +438,7 @@ class DodSession():
         Count the number of cards in the players hand for the range indicated.
         If a suit is provided then the count will only include cards of that
         suit. A suit of None will cause cards of all suits to be counted.
+        The question and the answer are remembered in questions.
 
         Args:
             player : Integer indicating the player. Player indexes start at 1
@@ -458,4 +459,6 @@ class DodSession():
         if player <= 0 or player > self.num_players:
             raise DodException("Invalid player")
 
-        return self.hands[player-1].count_suit(start, end, suit)
\ No newline at end of file
+        card_count = self.hands[player-1].count_suit(start, end, suit)
+        self.questions.append((player, start, end, suit, card_count))
+        return card_count
\ No newline at end of file
@@ -0,0 +1,1020 @@
+"""Deduction engine for a training game of Deduce or Die
+
+Work out which cards are likely to be the evidence using only the
+information the human player (player 1) has: their own hand, the exposed
+card, the least suit each player announced and the answers to every
+question asked so far.
+
+Cards are handled as bits in an integer so that a hand or a question
+is a single mask.
+"""
+
+import itertools
+import logging
+import math
+import multiprocessing
+import random
+import threading
+import time
+
+# numpy is optional. Without it the estimate is dealt one deal at a time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from dod_game import Card, DodException
+
+
+NUM_RANKS = len(Card.ranks)
+NUM_CARDS = len(Card.suits) * NUM_RANKS
+
+# One mask per suit, in the order of Card.suits
+SUIT_MASKS = [((1 << NUM_RANKS) - 1) << (s * NUM_RANKS)
+              for s in range(len(Card.suits))]
+
+
+class SolveTooLarge(Exception):
+    """There are too many deals to count in a reasonable time"""
+    pass
+
+
+def card_index(card):
+    """The bit position of a card"""
+    return Card.suits.index(card.suit) * NUM_RANKS + card.rank - 1
+
+
+def index_card(idx):
+    """The card for a bit position"""
+    return Card(Card.ranks[idx % NUM_RANKS], Card.suits[idx // NUM_RANKS])
+
+
+def cards_mask(cards):
+    """The mask for a list of cards"""
+    mask = 0
+    for c in cards:
+        mask |= 1 << card_index(c)
+    return mask
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def query_mask(start, end, suit):
+    """The mask for a question, using the same wrapping rules as Hand
+
+    Args:
+        start, end : Integers. The range of ranks inclusive. The range wraps.
+        suit : A letter for the suit. Case insensitive.
+               None if all suits are included.
+    """
+    if start <= end:
+        ranks = range(start, end + 1)
+    else:
+        ranks = range(start, NUM_RANKS + 1) + range(1, end + 1)
+
+    if suit:
+        suits = [Card.suits.index(suit.upper())]
+    else:
+        suits = range(len(Card.suits))
+
+    mask = 0
+    for s in suits:
+        for r in ranks:
+            mask |= 1 << (s * NUM_RANKS + r - 1)
+    return mask
+
+
+class Observations():
+    """Everything the human player knows about a session
+
+    This is a snapshot. It will not change when more questions are asked
+    of the session so it is safe to hand to another thread.
+    """
+
+    def __init__(self, session):
+        """Take a snapshot of what player 1 knows
+
+        Args:
+            session : The DodSession being played
+        """
+
+        self.hand_size = len(session.hands[0].cards)
+        known = cards_mask(session.hands[0].cards)
+        if session.exposed:
+            known |= cards_mask(session.exposed)
+
+        self.unknown = [i for i in range(NUM_CARDS) if not known & (1 << i)]
+        self.unknown_mask = ((1 << NUM_CARDS) - 1) & ~known
+
+        # The other players, the human is always player 1
+        self.players = [int(h.player) for h in session.hands[1:]]
+        self.least = dict((int(h.player), Card.suits.index(h.least))
+                          for h in session.hands[1:])
+
+        #
+        # Questions asked of the human tell us nothing new
+        #
+        self.asks = dict((p, []) for p in self.players)
+        for (player, start, end, suit, count) in session.questions:
+            if player in self.asks:
+                self.asks[player].append((query_mask(start, end, suit), count))
+
+    def hand_weight(self, player, hand):
+        """How likely a player would be to hold a hand given what we know
+
+        A hand that disagrees with an answer is impossible. When several
+        suits are tied for least the player picked one at random so the
+        announcement is only that likely.
+
+        Args:
+            player : Integer for the player [2-6]
+            hand : The mask of the cards in the hand
+
+        Returns:
+            A weight between 0 and 1
+        """
+
+        for (mask, count) in self.asks[player]:
+            if popcount(hand & mask) != count:
+                return 0.0
+
+        counts = [popcount(hand & m) for m in SUIT_MASKS]
+        least = min(counts)
+        if counts[self.least[player]] != least:
+            return 0.0
+
+        return 1.0 / counts.count(least)
+
+
+class Posterior():
+    """How likely each pair of cards is to be the evidence"""
+
+    # z score for the confidence bounds of an estimate
+    z = 1.96
+
+    def __init__(self, weights, exact, samples=0, ess=0.0):
+        """Turn evidence weights into probabilities
+
+        Args:
+            weights : A dict of (card index, card index) to weight
+            exact : True if the weights come from counting every deal
+            samples : The number of deals sampled for an estimate
+            ess : The effective sample size of an estimate
+        """
+
+        self.exact = exact
+        self.samples = samples
+        self.ess = ess
+        # Said alongside an estimate, like why there is no exact answer
+        self.note = None
+        self.ranking = []
+
+        total = sum(weights.values())
+        if not total:
+            return
+
+        for (pair, w) in weights.items():
+            p = w / total
+            if exact or not ess:
+                (low, high) = (p, p)
+            else:
+                margin = Posterior.z * math.sqrt(p * (1.0 - p) / ess)
+                (low, high) = (max(0.0, p - margin), min(1.0, p + margin))
+            cards = [index_card(i) for i in pair]
+            self.ranking.append((cards, p, low, high))
+
+        self.ranking.sort(key=lambda r: r[1], reverse=True)
+
+    def report(self, top=5):
+        """Describe the most likely evidence
+
+        Args:
+            top : The number of evidence pairs to show
+
+        Returns:
+            A string ready to print
+        """
+
+        if self.exact:
+            lines = ["Exact: {} possible evidence pairs".format(
+                len(self.ranking))]
+        elif not self.samples:
+            lines = ["Estimate: no samples drawn"]
+        elif self.ranking:
+            lines = ["Estimate: {} samples (ESS {:.1f})".format(
+                self.samples, self.ess)]
+        else:
+            lines = ["Estimate: no consistent deals found in {} samples".format(
+                self.samples)]
+
+        if self.note:
+            lines[0] += ", " + self.note
+
+        for idx, (cards, p, low, high) in enumerate(self.ranking[:top], start=1):
+            line = "{:>2}. {} {:5.1f}%".format(idx, cards, p * 100)
+            if not self.exact:
+                line += " ({:.1f}% - {:.1f}%)".format(low * 100, high * 100)
+            lines.append(line)
+
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return self.report()
+
+
+def choose(n, k):
+    """The number of ways to pick k things from n"""
+    if k < 0 or k > n:
+        return 0
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+class ExactSolver():
+    """Count every deal that agrees with what player 1 knows
+
+    The work grows with the number of players. Each extra player is
+    another hand to split the unknown cards into, so a 6 player game with
+    few answers has far too many deals to count. The answers and least
+    suits cut the search down, so a solve gets quicker as questions are
+    asked.
+    """
+
+    # Give up after this many seconds. Early in a game with 4 or more
+    # players the solve could take minutes and the estimate is the better
+    # answer.
+    time_limit = 20.0
+
+    def __init__(self, observations):
+        """
+        Args:
+            observations : The Observations to solve
+        """
+
+        self.obs = observations
+        self.__work = 0
+        self.__next_check = 0
+        self.__give_up = None
+        # How long the last solve took and how big it got
+        self.stats = None
+
+    def __count_work(self, n):
+        #
+        # Look at the clock every 100,000 hands or so
+        #
+        self.__work += n
+        if self.__work >= self.__next_check:
+            self.__next_check = self.__work + 100000
+            if time.time() > self.__give_up:
+                raise SolveTooLarge()
+
+    def __hands(self, player):
+        #
+        # Every hand the player could hold, with its weight.
+        # Cards are considered one at a time, taken or left, and a branch
+        # is dropped as soon as an answer could no longer come out right.
+        #
+        asks = self.obs.asks[player]
+        cards = self.obs.unknown
+        size = self.obs.hand_size
+        member = [[bool(m & (1 << c)) for (m, count) in asks] for c in cards]
+
+        # in_rest[i][k] : cards from i onwards in answer k
+        in_rest = [[0] * len(asks) for i in range(len(cards) + 1)]
+        for i in range(len(cards) - 1, -1, -1):
+            in_rest[i] = [n + member[i][k] for (k, n) in enumerate(in_rest[i + 1])]
+
+        hands = {}
+
+        def pick(i, hand, taken, need):
+            self.__count_work(1)
+            room = size - taken
+            rest = len(cards) - i
+            if room > rest:
+                return
+            for (k, n) in enumerate(need):
+                if n < 0 or n > in_rest[i][k] or n > room:
+                    return
+                if room - n > rest - in_rest[i][k]:
+                    return
+
+            if not room:
+                w = self.obs.hand_weight(player, hand)
+                if w:
+                    hands[hand] = w
+                return
+
+            taken_need = [n - member[i][k] for (k, n) in enumerate(need)]
+            pick(i + 1, hand | (1 << cards[i]), taken + 1, taken_need)
+            pick(i + 1, hand, taken, need)
+
+        pick(0, 0, 0, [count for (m, count) in asks])
+        return hands
+
+    def __ways(self, idx, mask):
+        #
+        # The weighted number of ways the players from idx onwards
+        # can split the cards in mask between them.
+        # The last player takes whatever is left.
+        #
+        key = (idx, mask)
+        if key in self.__memo:
+            return self.__memo[key]
+
+        hands = self.__valid[idx]
+        if idx == len(self.__valid) - 1:
+            total = hands.get(mask, 0.0)
+        else:
+            total = 0.0
+            #
+            # Either run through the hands the player could hold or
+            # through the hands that can be made from the cards left,
+            # whichever is fewer.
+            #
+            cards = [1 << i for i in range(NUM_CARDS) if mask & (1 << i)]
+            size = self.obs.hand_size
+            if len(hands) <= choose(len(cards), size):
+                self.__count_work(len(hands))
+                candidates = [(h, w) for (h, w) in hands.items()
+                              if h & mask == h]
+            else:
+                self.__count_work(choose(len(cards), size))
+                candidates = []
+                for combo in itertools.combinations(cards, size):
+                    h = sum(combo)
+                    if h in hands:
+                        candidates.append((h, hands[h]))
+
+            for (h, w) in candidates:
+                total += w * self.__ways(idx + 1, mask & ~h)
+
+        self.__memo[key] = total
+        return total
+
+    def solve(self):
+        """Weigh every possible pair of evidence cards
+
+        Returns:
+            An exact Posterior
+
+        Raises:
+            SolveTooLarge : There are too many deals to count
+        """
+
+        start = time.time()
+        self.__give_up = start + ExactSolver.time_limit
+        self.__work = 0
+        self.__next_check = 0
+        self.__memo = {}
+
+        #
+        # The player with the most possible hands goes last. The last
+        # player is only looked up, never searched.
+        #
+        weights = {}
+        try:
+            self.__valid = sorted((self.__hands(p) for p in self.obs.players),
+                                  key=len)
+            for pair in itertools.combinations(self.obs.unknown, 2):
+                rest = self.obs.unknown_mask & ~((1 << pair[0]) | (1 << pair[1]))
+                w = self.__ways(0, rest)
+                if w:
+                    weights[pair] = w
+        finally:
+            #
+            # Nothing is logged here. The solve runs in a forked process
+            # where the logging locks may have been copied while held.
+            #
+            self.stats = "{:.2f}s {} states {} hands".format(
+                time.time() - start, len(self.__memo), self.__work)
+            self.__memo = None
+
+        return Posterior(weights, True)
+
+
+def _exact_worker(obs, conn):
+    #
+    # Run the exact solve in its own process so it doesn't hold up
+    # the prompt or the sampler. Sends the result, or None if it is too
+    # large, along with the solve stats for the parent to log.
+    #
+    solver = ExactSolver(obs)
+    try:
+        result = solver.solve()
+    except SolveTooLarge:
+        result = None
+    conn.send((result, solver.stats))
+    conn.close()
+
+
+# Set in each worker process of a SamplerPool
+_worker_stop = None
+
+
+def _init_worker(stop):
+    global _worker_stop
+    _worker_stop = stop
+
+
+def _sample_worker(args):
+    #
+    # Run a sampler in a worker process. Each process needs its own
+    # random state or they would all draw the same deals.
+    #
+    (obs, deadline, seed) = args
+    random.seed(seed)
+    if numpy is not None:
+        numpy.random.seed(seed)
+    return ImportanceSampler(obs).draw(deadline, _worker_stop)
+
+
+class SamplerPool():
+    """Worker processes that sample together
+
+    The processes are started once and kept for the whole game. They
+    share a stop flag so an exact answer that arrives part way through
+    the time budget stops them all.
+    """
+
+    def __init__(self, processes):
+        """
+        Args:
+            processes : The number of worker processes
+        """
+
+        self.processes = processes
+        self.stop = multiprocessing.Event()
+        self.__pool = multiprocessing.Pool(processes, _init_worker,
+                                           (self.stop,))
+
+    def draw(self, obs, deadline, stop=None):
+        """Draw weighted deals in every worker until the deadline
+
+        Args:
+            obs : The Observations to sample
+            deadline : The time.time() to stop sampling
+            stop : An optional threading.Event to stop sampling early
+
+        Returns:
+            A list of the results of ImportanceSampler.draw, one per worker
+        """
+
+        self.stop.clear()
+        jobs = [(obs, deadline, random.getrandbits(32))
+                for i in range(self.processes)]
+        result = self.__pool.map_async(_sample_worker, jobs)
+
+        if stop is not None:
+            stop.wait(max(0.0, deadline - time.time()))
+            if stop.is_set():
+                self.stop.set()
+
+        return result.get()
+
+    def close(self):
+        """Stop the worker processes"""
+
+        self.stop.set()
+        self.__pool.terminate()
+        self.__pool.join()
+
+
+class ImportanceSampler():
+    """Estimate the evidence with sequential importance sampling
+
+    Naive rejection, dealing at random and throwing away deals that
+    disagree with an answer, collapses after a few questions because
+    almost every deal is thrown away.
+
+    Instead the unknown cards are dealt one at a time. Each card only goes
+    to the evidence or a player where every answer and least suit can
+    still come out right. The card picks among those with the odds of a
+    fair deal and the deal is weighted by how much of the fair deal was
+    ruled out along the way.
+    """
+
+    # Deals dealt together when numpy is available
+    batch = 2000
+
+    def __init__(self, observations):
+        """
+        Args:
+            observations : The Observations to sample
+        """
+
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.obs = observations
+
+        #
+        # Slot 0 is the evidence, slots 1 on are the other players
+        #
+        self.__slots = len(observations.players) + 1
+        self.__capacity = [2] + [observations.hand_size] * len(observations.players)
+        self.__least = [None] + [observations.least[p]
+                                 for p in observations.players]
+
+        #
+        # Every answer, by the slot it was asked of and the count.
+        # The unassigned cards in and out of each answer at the start.
+        #
+        masks = []
+        self.__asks = []
+        for (slot, p) in enumerate(observations.players, start=1):
+            for (mask, count) in observations.asks[p]:
+                masks.append(mask)
+                self.__asks.append((slot, count))
+        self.__inside = [popcount(observations.unknown_mask & m) for m in masks]
+        self.__outside = [len(observations.unknown) - n for n in self.__inside]
+        self.__left = [popcount(observations.unknown_mask & m)
+                       for m in SUIT_MASKS]
+
+        # For each card, whether it is in each answer
+        self.__member = dict((c, [bool(m & (1 << c)) for m in masks])
+                             for c in observations.unknown)
+
+        #
+        # Deal the most asked about cards first so a deal that can't work
+        # is found out early.
+        #
+        asked = lambda c: sum(self.__member[c])
+        self.__order = sorted(observations.unknown, key=asked, reverse=True)
+
+    def __deal(self):
+        #
+        # Deal one weighted sample.
+        # Returns the evidence pair and the weight of the deal.
+        #
+        slots = self.__slots
+        asks = self.__asks
+        least = self.__least
+        cap = list(self.__capacity)
+        need = [count for (slot, count) in asks]
+        inside = list(self.__inside)
+        outside = list(self.__outside)
+        left = list(self.__left)
+        have = [[0] * len(SUIT_MASKS) for i in range(slots)]
+        hands = [0] * slots
+        total = sum(cap)
+        weight = 1.0
+
+        for c in self.__order:
+            member = self.__member[c]
+            suit = c // NUM_RANKS
+            left[suit] -= 1
+
+            #
+            # For each slot, can everything still come out right if the
+            # card goes elsewhere (without) or if it goes there (fits)?
+            # Each answer only needs checking once per card.
+            #
+            without = [True] * slots
+            fits = [bool(n) for n in cap]
+            for (k, (s, count)) in enumerate(asks):
+                n = need[k]
+                room = cap[s]
+                if member[k]:
+                    inside[k] -= 1
+                    if n > inside[k] or room - n > outside[k]:
+                        without[s] = False
+                    if n < 1 or n - 1 > inside[k] or room - n > outside[k]:
+                        fits[s] = False
+                else:
+                    outside[k] -= 1
+                    if room - n > outside[k]:
+                        without[s] = False
+                    if n > inside[k] or n > room - 1 or room - 1 - n > outside[k]:
+                        fits[s] = False
+
+            for s in range(1, slots):
+                held = have[s]
+                room = cap[s]
+                l = least[s]
+                for t in range(len(left)):
+                    if held[l] > held[t] + min(room, left[t]):
+                        without[s] = False
+                if fits[s]:
+                    with_card = list(held)
+                    with_card[suit] += 1
+                    for t in range(len(left)):
+                        if with_card[l] > with_card[t] + min(room - 1, left[t]):
+                            fits[s] = False
+
+            blocked = [s for s in range(slots) if not without[s]]
+            if len(blocked) > 1:
+                return (None, 0.0)
+            elif blocked:
+                choices = [s for s in blocked if fits[s]]
+            else:
+                choices = [s for s in range(slots) if fits[s]]
+            if not choices:
+                return (None, 0.0)
+
+            #
+            # A fair deal gives the card to a slot in proportion to the
+            # cards it still takes. Only pick from the slots that work.
+            #
+            room = sum(cap[s] for s in choices)
+            weight *= float(room) / total
+            total -= 1
+            pick = random.random() * room
+            for slot in choices:
+                pick -= cap[slot]
+                if pick < 0:
+                    break
+
+            cap[slot] -= 1
+            have[slot][suit] += 1
+            hands[slot] |= 1 << c
+            for (k, (s, count)) in enumerate(asks):
+                if s == slot and member[k]:
+                    need[k] -= 1
+
+        #
+        # Ties for least suit were broken at random
+        #
+        for (slot, p) in enumerate(self.obs.players, start=1):
+            weight *= self.obs.hand_weight(p, hands[slot])
+
+        pair = tuple(i for i in range(NUM_CARDS) if hands[0] & (1 << i))
+        return (pair, weight)
+
+    def __deal_batch(self, n):
+        #
+        # Deal n weighted samples at once with numpy. The same steps as
+        # __deal, but every piece of state that differs between deals is
+        # an array with a row per deal. The cards are dealt in the same
+        # order in every deal, so the unassigned counts are shared.
+        #
+        # Returns the evidence pair codes (first * NUM_CARDS + second)
+        # and the weight of each deal.
+        #
+        np = numpy
+        slots = self.__slots
+        players = slots - 1
+        asks = self.__asks
+        ask_slot = np.array([s for (s, count) in asks], dtype=int)
+        # ask_of_slot[k, slot] is 1 if answer k was asked of the slot
+        ask_of_slot = np.zeros((len(asks), slots), dtype=int)
+        ask_of_slot[np.arange(len(asks)), ask_slot] = 1
+        least = np.array(self.__least[1:], dtype=int)
+        rows = np.arange(n)
+        player_idx = np.arange(players)
+
+        # Every count fits in a byte and small arrays are quicker to work on
+        cap = np.tile(np.array(self.__capacity, dtype=np.int8), (n, 1))
+        need = np.tile(np.array([count for (s, count) in asks], dtype=np.int8),
+                       (n, 1))
+        inside = np.array(self.__inside, dtype=np.int8)
+        outside = np.array(self.__outside, dtype=np.int8)
+        left = np.array(self.__left, dtype=np.int8)
+        have = np.zeros((n, slots, len(SUIT_MASKS)), dtype=np.int8)
+        evidence = np.full((n, 2), -1, dtype=int)
+        weight = np.ones(n)
+        total = sum(self.__capacity)
+
+        def asks_ok(n_need, n_cap):
+            return ((n_need >= 0) & (n_need <= inside) & (n_need <= n_cap) &
+                    (n_cap - n_need <= outside))
+
+        def least_ok(held, n_cap):
+            held_least = held[:, player_idx, least]
+            bound = held + np.minimum(n_cap[:, :, None], left[None, None, :])
+            return (held_least[:, :, None] <= bound).all(axis=2)
+
+        for c in self.__order:
+            member = np.array(self.__member[c], dtype=bool)
+            suit = c // NUM_RANKS
+            left[suit] -= 1
+            inside -= member
+            outside -= ~member
+
+            ask_cap = cap[:, ask_slot]
+            without_ask = asks_ok(need, ask_cap)
+            with_ask = asks_ok(need - member, ask_cap - 1)
+
+            # Count the answers that fail for each slot
+            without = (~without_ask).astype(int).dot(ask_of_slot) == 0
+            fits = (cap > 0) & ((~with_ask).astype(int).dot(ask_of_slot) == 0)
+
+            held = have[:, 1:, :]
+            without[:, 1:] &= least_ok(held, cap[:, 1:])
+            held_with = held.copy()
+            held_with[:, :, suit] += 1
+            fits[:, 1:] &= least_ok(held_with, cap[:, 1:] - 1)
+
+            #
+            # A slot can take the card if it fits there and every other
+            # slot is fine without it
+            #
+            blocked = (~without).sum(axis=1)
+            choices = fits & ((blocked[:, None] - ~without) == 0)
+            room_each = cap * choices
+            room = room_each.sum(axis=1)
+            weight *= room / float(total)
+            total -= 1
+
+            pick = np.random.random(n) * room
+            chosen = (room_each.cumsum(axis=1) <= pick[:, None]).sum(axis=1)
+            chosen = np.minimum(chosen, slots - 1)
+
+            cap[rows, chosen] -= 1
+            have[rows, chosen, suit] += 1
+            need -= member[None, :] & (ask_slot[None, :] == chosen[:, None])
+            to_evidence = chosen == 0
+            second = to_evidence & (evidence[:, 0] >= 0)
+            evidence[to_evidence & ~second, 0] = c
+            evidence[second, 1] = c
+
+        #
+        # Ties for least suit were broken at random
+        #
+        held = have[:, 1:, :]
+        lowest = held.min(axis=2)
+        ties = (held == lowest[:, :, None]).sum(axis=2)
+        is_least = held[:, player_idx, least] == lowest
+        weight *= (is_least / ties.astype(float)).prod(axis=1)
+
+        codes = evidence.min(axis=1) * NUM_CARDS + evidence.max(axis=1)
+        return (codes[weight > 0], weight[weight > 0])
+
+    def draw(self, deadline, stop=None):
+        """Draw weighted deals until the deadline
+
+        Args:
+            deadline : The time.time() to stop sampling
+            stop : An optional Event, from threading or multiprocessing,
+                   to stop sampling early
+
+        Returns:
+            A tuple of the evidence weights, the number of deals, the sum
+            of the weights and the sum of the squared weights
+        """
+
+        weights = {}
+        samples = 0
+        (w_sum, w_sq) = (0.0, 0.0)
+        if numpy is not None:
+            totals = numpy.zeros(NUM_CARDS * NUM_CARDS)
+            while time.time() < deadline and not (stop and stop.is_set()):
+                (codes, w) = self.__deal_batch(ImportanceSampler.batch)
+                samples += ImportanceSampler.batch
+                totals += numpy.bincount(codes, weights=w,
+                                         minlength=len(totals))
+                w_sum += w.sum()
+                w_sq += (w * w).sum()
+            for code in numpy.flatnonzero(totals):
+                pair = (int(code) // NUM_CARDS, int(code) % NUM_CARDS)
+                weights[pair] = float(totals[code])
+            return (weights, samples, float(w_sum), float(w_sq))
+
+        while time.time() < deadline and not (stop and stop.is_set()):
+            for i in range(10):
+                (pair, w) = self.__deal()
+                samples += 1
+                if w:
+                    weights[pair] = weights.get(pair, 0.0) + w
+                    w_sum += w
+                    w_sq += w * w
+
+        return (weights, samples, w_sum, w_sq)
+
+    def sample(self, deadline, stop=None, pool=None):
+        """Estimate the evidence from weighted deals
+
+        Args:
+            deadline : The time.time() to stop sampling
+            stop : An optional threading.Event to stop sampling early
+            pool : An optional SamplerPool to sample with. Otherwise
+                   sample in this process.
+
+        Returns:
+            An estimated Posterior
+        """
+
+        if pool:
+            results = pool.draw(self.obs, deadline, stop)
+        else:
+            results = [self.draw(deadline, stop)]
+
+        tally = Tally()
+        for r in results:
+            tally.add(r)
+
+        self.log.info("Sampled: {} ESS: {:.1f}".format(tally.samples,
+                                                       tally.ess()))
+        return tally.posterior()
+
+
+class Tally():
+    """Running totals of weighted deals"""
+
+    def __init__(self):
+        self.weights = {}
+        self.samples = 0
+        self.w_sum = 0.0
+        self.w_sq = 0.0
+
+    def add(self, result):
+        """Add the result of ImportanceSampler.draw to the totals"""
+
+        (r_weights, r_samples, r_sum, r_sq) = result
+        for (pair, w) in r_weights.items():
+            self.weights[pair] = self.weights.get(pair, 0.0) + w
+        self.samples += r_samples
+        self.w_sum += r_sum
+        self.w_sq += r_sq
+
+    def ess(self):
+        #
+        # Kish's effective sample size. How many fair deals the weighted
+        # deals are worth.
+        #
+        if not self.w_sq:
+            return 0.0
+        return self.w_sum * self.w_sum / self.w_sq
+
+    def posterior(self):
+        """An estimated Posterior from the totals so far"""
+
+        return Posterior(dict(self.weights), False, self.samples, self.ess())
+
+
+class AnytimeSolver():
+    """Keep solving the current game state in the background
+
+    Each time the game changes two things start on the new state and
+    the old ones are stopped. An exact solve runs in its own process. It
+    gets slower with every extra player and is given up on when there are
+    too many deals to count. Meanwhile a sampler thread keeps adding
+    weighted deals to a running estimate, so the estimate gets better
+    the longer the state is left alone. The sampler stops when the exact
+    answer arrives or the estimate is good enough.
+    """
+
+    # Seconds of sampling between additions to the running estimate
+    chunk = 0.25
+
+    # Stop refining once the estimate is worth this many fair deals
+    ess_target = 100000
+
+    def __init__(self, processes=1):
+        """
+        Args:
+            processes : The number of processes to sample estimates with
+        """
+
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.__pool = None
+        if processes > 1:
+            self.__pool = SamplerPool(processes)
+        self.__lock = threading.Lock()
+        self.__obs = None
+        self.__tally = None
+        self.__settled = None
+        self.__stop = None
+        self.__result = None
+        self.__too_large = False
+        self.__process = None
+        self.__thread = None
+        self.__sampler = None
+
+    def update(self, session):
+        """Start solving the current state of a session
+
+        Args:
+            session : The DodSession being played
+        """
+
+        obs = Observations(session)
+        self.__halt()
+
+        (conn, child_conn) = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(target=_exact_worker,
+                                          args=(obs, child_conn))
+        process.daemon = True
+        tally = Tally()
+        settled = threading.Event()
+        stop = threading.Event()
+        with self.__lock:
+            (self.__obs, self.__tally) = (obs, tally)
+            (self.__settled, self.__stop) = (settled, stop)
+            self.__process = process
+            self.__result = None
+            self.__too_large = False
+
+        process.start()
+        child_conn.close()
+
+        self.__thread = threading.Thread(target=self.__wait,
+                                         args=(obs, conn, settled, stop))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        self.__sampler = threading.Thread(target=self.__refine,
+                                          args=(obs, tally, settled, stop))
+        self.__sampler.daemon = True
+        self.__sampler.start()
+
+    def __halt(self):
+        #
+        # Stop working on the old state. The sampler is waited for so it
+        # never shares the pool with the sampler for the new state.
+        #
+        with self.__lock:
+            if self.__stop:
+                self.__stop.set()
+            if self.__process:
+                self.__process.terminate()
+            (thread, sampler) = (self.__thread, self.__sampler)
+
+        if sampler:
+            sampler.join()
+        return thread
+
+    def stop(self):
+        """Abandon any solve in progress and stop the sampling processes"""
+
+        thread = self.__halt()
+        if thread:
+            thread.join()
+
+        if self.__pool:
+            self.__pool.close()
+
+    def __wait(self, obs, conn, settled, stop):
+        try:
+            (result, stats) = conn.recv()
+        except EOFError:
+            self.log.debug("Exact solve abandoned")
+            return
+        finally:
+            conn.close()
+
+        with self.__lock:
+            if obs is not self.__obs:
+                return
+            if result is None:
+                self.log.info("Exact solve too large: {}".format(stats))
+                self.__too_large = True
+            else:
+                self.log.info("Exact solve: {}".format(stats))
+                self.__result = result
+                stop.set()
+                settled.set()
+
+    def __refine(self, obs, tally, settled, stop):
+        sampler = ImportanceSampler(obs)
+        while not stop.is_set():
+            deadline = time.time() + AnytimeSolver.chunk
+            if self.__pool:
+                results = self.__pool.draw(obs, deadline, stop)
+            else:
+                results = [sampler.draw(deadline, stop)]
+
+            with self.__lock:
+                for r in results:
+                    tally.add(r)
+                ess = tally.ess()
+
+            if ess >= AnytimeSolver.ess_target:
+                self.log.info("Estimate settled: {} samples ESS: {:.1f}".format(
+                    tally.samples, ess))
+                settled.set()
+                return
+
+    def posterior(self, budget):
+        """The best answer available within a time budget
+
+        The running estimate keeps improving in the background while this
+        waits, so it is topped up for at most the budget.
+
+        Args:
+            budget : Seconds to wait if the exact solve isn't finished
+
+        Returns:
+            The exact Posterior if it is ready in time. Otherwise the
+            running estimated Posterior.
+
+        Raises:
+            DodException : No session has been given to solve
+        """
+
+        with self.__lock:
+            (obs, settled) = (self.__obs, self.__settled)
+
+        if obs is None:
+            raise DodException("Nothing to solve yet")
+
+        settled.wait(budget)
+
+        with self.__lock:
+            if self.__result is not None and obs is self.__obs:
+                return self.__result
+            estimate = self.__tally.posterior()
+            if self.__too_large:
+                estimate.note = "too many deals for an exact answer"
+
+        self.log.info("Estimate: {} samples ESS: {:.1f}".format(
+            estimate.samples, estimate.ess))
+        return estimate
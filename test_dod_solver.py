@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""Check the deduction engine against slower, simpler answers
+
+Run with:
+    python -m unittest test_dod_solver
+"""
+
+import itertools
+import math
+import random
+import time
+import unittest
+
+import dod_solver
+from dod_game import DodSession
+from dod_solver import ExactSolver, ImportanceSampler, Observations, Tally
+
+# Ranges asked in every game. Players are picked at random.
+QUESTIONS = [(1, 5, None), (2, 7, 'h'), (4, 9, 's'), (6, 2, None),
+             (1, 9, 'd'), (3, 6, None), (8, 3, 'h'), (5, 9, None),
+             (2, 4, 's'), (7, 1, 'd'), (1, 3, None), (4, 8, 'h')]
+
+
+def seeded_session(num_players, num_questions, seed):
+    """A session with questions already asked, the same for each seed"""
+
+    random.seed(seed)
+    session = DodSession(num_players)
+    for (start, end, suit) in QUESTIONS[:num_questions]:
+        player = random.randint(2, num_players)
+        session.count_suit(player, start, end, suit)
+    return session
+
+
+def brute_force(obs):
+    #
+    # Weigh the evidence for a 3 player game by dealing every hand
+    # to player 2 and every way of splitting what's left between
+    # player 3 and the evidence. Only hand_weight is used.
+    #
+    (p2, p3) = obs.players
+    weights = {}
+    for hand in itertools.combinations(obs.unknown, obs.hand_size):
+        w2 = obs.hand_weight(p2, sum(1 << c for c in hand))
+        if not w2:
+            continue
+        rest = [c for c in obs.unknown if c not in hand]
+        for pair in itertools.combinations(rest, 2):
+            other = sum(1 << c for c in rest if c not in pair)
+            w3 = obs.hand_weight(p3, other)
+            if w3:
+                weights[pair] = weights.get(pair, 0.0) + w2 * w3
+
+    total = sum(weights.values())
+    return dict((pair, w / total) for (pair, w) in weights.items())
+
+
+def exact_probabilities(posterior):
+    return dict((tuple(sorted(dod_solver.card_index(c) for c in cards)), p)
+                for (cards, p, low, high) in posterior.ranking)
+
+
+def card_probabilities(probabilities):
+    # How likely each card is to be one of the evidence
+    cards = {}
+    for (pair, p) in probabilities.items():
+        for card in pair:
+            cards[card] = cards.get(card, 0.0) + p
+    return cards
+
+
+def estimate(obs, ess_target, time_limit):
+    #
+    # Sample in short bursts until the estimate is worth ess_target
+    # fair deals, so a slow sampler is judged on as much as a fast one.
+    #
+    random.seed(0)
+    if dod_solver.numpy is not None:
+        dod_solver.numpy.random.seed(0)
+    sampler = ImportanceSampler(obs)
+    tally = Tally()
+    give_up = time.time() + time_limit
+    while tally.ess() < ess_target and time.time() < give_up:
+        tally.add(sampler.draw(time.time() + 0.5))
+    return tally.posterior()
+
+
+class ExactSolverTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        for (num_questions, seed) in [(2, 0), (2, 1), (3, 0), (3, 2)]:
+            obs = Observations(seeded_session(3, num_questions, seed))
+            expected = brute_force(obs)
+            found = exact_probabilities(ExactSolver(obs).solve())
+
+            self.assertEqual(set(found), set(expected))
+            for pair in expected:
+                self.assertAlmostEqual(found[pair], expected[pair])
+
+
+class ImportanceSamplerTest(unittest.TestCase):
+
+    ess_target = 100
+    time_limit = 30.0
+
+    def check_sampler(self, num_players, num_questions, seed):
+        obs = Observations(seeded_session(num_players, num_questions, seed))
+        expected = exact_probabilities(ExactSolver(obs).solve())
+        posterior = estimate(obs, self.ess_target, self.time_limit)
+        found = exact_probabilities(posterior)
+
+        # A pair the exact solver rules out must never be dealt
+        self.assertTrue(set(found) <= set(expected))
+        self.assertTrue(posterior.ess >= self.ess_target)
+
+        # Each card's chance of being evidence, within 5 standard errors
+        expected_cards = card_probabilities(expected)
+        found_cards = card_probabilities(found)
+        for (card, p) in expected_cards.items():
+            error = math.sqrt(p * (1 - p) / posterior.ess)
+            self.assertTrue(abs(found_cards.get(card, 0.0) - p) <= 5 * error,
+                            "card %d: %.3f, exact %.3f"
+                            % (card, found_cards.get(card, 0.0), p))
+
+    @unittest.skipIf(dod_solver.numpy is None, 'numpy is not installed')
+    def test_matches_exact(self):
+        for (num_players, num_questions, seed) in [(4, 8, 0), (5, 8, 1),
+                                                    (6, 12, 1)]:
+            self.check_sampler(num_players, num_questions, seed)
+
+    def test_matches_exact_without_numpy(self):
+        saved = dod_solver.numpy
+        dod_solver.numpy = None
+        try:
+            self.check_sampler(6, 12, 1)
+        finally:
+            dod_solver.numpy = saved
+
+
+if __name__ == '__main__':
+    unittest.main()